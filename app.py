@@ -4,13 +4,19 @@ import re
 import json
 import sqlite3
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, g
+from flask import Flask, render_template, request, redirect, url_for, flash, session, g, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, Text, DateTime
+from sqlalchemy import Column, Integer, Text, DateTime, LargeBinary, Index, event, insert
+from sqlalchemy.engine import Engine
+import zstandard as zstd
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
-import io
-import random
+import lxml.html
 
 # ---------- CONFIG ----------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -26,6 +32,33 @@ app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + DB_PATH
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 db = SQLAlchemy(app)
 
+# Shared HTTP session: reusing pooled keep-alive connections avoids a fresh
+# TCP + TLS handshake on every call to the eCourts host.
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+)
+_SESSION.mount("https://", _adapter)
+_SESSION.mount("http://", _adapter)
+_SESSION.headers.update({
+    "User-Agent": "Court-Data-Fetcher/1.0 (+https://github.com/yourname)",
+    # Ask for compressed transfer explicitly (5-10x fewer bytes on HTML even
+    # when a server would not negotiate it by default); urllib3 decompresses
+    # transparently on r.content. Only encodings urllib3 can actually decode
+    # belong here — advertising br without the brotli package would hand the
+    # parser raw brotli bytes.
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+})
+
+# Court records change at most daily but users re-query the same case often;
+# a short TTL cache lets repeat queries skip the network fetch and parse.
+# Only successful results are cached (never errors or captcha challenges).
+_FETCH_CACHE = TTLCache(maxsize=512, ttl=600)
+_FETCH_CACHE_LOCK = threading.Lock()
+
 # ---------- DB MODELS ----------
 class QueryLog(db.Model):
     __tablename__ = "query_logs"
@@ -40,37 +73,185 @@ class RawResponse(db.Model):
     __tablename__ = "raw_responses"
     id = Column(Integer, primary_key=True)
     query_id = Column(Integer)
-    raw_html = Column(Text)
+    raw_html_zstd = Column(LargeBinary)
     parsed_json = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+Index("ix_raw_responses_query_id", RawResponse.query_id)
+
+# Core Table handles for the per-request log writes: plain inserts skip the
+# ORM's unit-of-work/identity-map machinery, which dominates the cost of
+# these two tiny rows. The ORM classes stay in use for reads.
+query_logs_t = QueryLog.__table__
+raw_responses_t = RawResponse.__table__
+
+# Raw eCourts pages run 200 KB-1 MB; zstd level 3 shrinks HTML ~10x, so we
+# store the compressed bytes instead of TEXT. One shared (de)compressor
+# avoids rebuilding the context per request, but python-zstandard contexts
+# are not safe for simultaneous use from multiple threads, so each is
+# guarded by a lock at the call sites.
+_ZSTD_COMPRESS = zstd.ZstdCompressor(level=3)
+_ZSTD_COMPRESS_LOCK = threading.Lock()
+_ZSTD_DECOMPRESS = zstd.ZstdDecompressor()
+_ZSTD_DECOMPRESS_LOCK = threading.Lock()
+
+# SQLite tuning: WAL lets readers proceed while we write the two log rows,
+# and synchronous=NORMAL skips the per-commit fsync (WAL still guarantees
+# consistency; at worst the last commit is lost on power failure, which is
+# fine for request logs).
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.close()
+
 # create tables if not present
 with app.app_context():
     db.create_all()
+    # create_all never alters existing tables, and databases created before
+    # the compressed store still carry the baseline raw_html TEXT schema: add
+    # the new column in place. Legacy raw_html rows are kept as-is and served
+    # by the raw_response view until they age out.
+    with db.engine.begin() as conn:
+        _rr_cols = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(raw_responses)")}
+        if "raw_html_zstd" not in _rr_cols:
+            conn.exec_driver_sql("ALTER TABLE raw_responses ADD COLUMN raw_html_zstd BLOB")
+_HAS_LEGACY_RAW_HTML = "raw_html" in _rr_cols
+
+# Pre-compiled parsing regex: compiling once at import keeps the per-request
+# hot path out of sre_parse / the bounded re module cache.
+# One alternation scans the page text a single time for all four labels
+# (instead of four whole-document passes); anchoring each label to a line
+# start avoids pathological backtracking on long digit/character runs.
+_RE_FIELDS = re.compile(
+    r"(?:^|\n)\s*(?P<k>Petitioner|Respondent|Filing Date|Next Hearing Date)s?\:?\s*(?P<v>[^\n]+)",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Anchors worth offering for download: direct PDFs plus the /viewOrder-style
+# order/judgment links some pages use instead.
+_RE_PDFISH = re.compile(r"\.pdf$|order|judgement|judgment", re.IGNORECASE)
+
+# XPath probes for the table-style layout (<td>Petitioner</td><td>Name</td>)
+# some eCourts pages use; evaluated once per fetch, entirely inside libxml2.
+# Label-in-same-text-node pages ("Petitioner: Name") are handled by the
+# _RE_FIELDS fallback over the page text.
+def _label_xpath(label):
+    # Exact match on the label cell (case-folded); contains() would also hit
+    # "Filing Date: ..." paragraphs whose value lives in the same node.
+    lower = label.lower()
+    return (
+        "//*[normalize-space(translate(text(), '%s', '%s')) = '%s']"
+        "/following-sibling::*[1]//text()" % (label.upper(), lower, lower)
+    )
+
+_FIELD_XPATHS = {
+    "petitioner": _label_xpath("Petitioner"),
+    "respondent": _label_xpath("Respondent"),
+    "filing date": _label_xpath("Filing Date"),
+    "next hearing date": _label_xpath("Next Hearing Date"),
+}
 
 # ---------- SIMPLE MATH CAPTCHA ----------
+# All 2 x 12 x 12 (question, answer) pairs fit in a small tuple, so build
+# them once at import and pick per request instead of redoing the arithmetic
+# and string formatting on every GET. Subtraction keeps the larger operand
+# first (non-negative answers), matching the old behaviour.
+_CAPTCHAS = tuple(
+    (f"{a} + {b}", str(a + b)) for a in range(1, 13) for b in range(1, 13)
+) + tuple(
+    (f"{max(a, b)} - {min(a, b)}", str(abs(a - b))) for a in range(1, 13) for b in range(1, 13)
+)
+
 def generate_captcha():
-    a = random.randint(1, 12)
-    b = random.randint(1, 12)
-    op = random.choice(["+", "-"])
-    if op == "-":
-        # ensure non-negative
-        if a < b:
-            a, b = b, a
-    question = f"{a} {op} {b}"
-    answer = eval(question)
-    return question, str(answer)
+    # Two bytes straight from the OS replace three Python-level PRNG state
+    # updates per GET (and the modulo bias over 288 entries is negligible).
+    idx = int.from_bytes(os.urandom(2), "little") % len(_CAPTCHAS)
+    return _CAPTCHAS[idx]
 
 # ---------- SCRAPING / FETCHING LOGIC ----------
-def detect_captcha_in_text(text):
-    """Detect keyword hints that a captcha or challenge is present."""
-    t = text.lower()
-    if "captcha" in t or "enter the" in t and ("captcha" in t or "enter the captcha" in t):
-        return True
-    # some NIC pages show "Enter Captcha" or image-based captcha
-    if "enter captcha" in t or "refresh image" in t:
-        return True
-    return False
+# Multi-keyword scanner over the raw response bytes: the compiled alternation
+# walks the page once in C (Aho-Corasick style) instead of one substring pass
+# per keyword, and avoids allocating a lowercased copy of the whole page.
+_CAPTCHA_KEYWORDS = (rb"captcha", rb"refresh image")
+_RE_CAPTCHA = re.compile(b"|".join(_CAPTCHA_KEYWORDS), re.IGNORECASE)
+
+def detect_captcha_in_text(raw_bytes):
+    """Detect keyword hints that a captcha or challenge is present.
+
+    Takes the undecoded response body so detection runs before any
+    full-page decode or parse. Covers "Enter Captcha" and the NIC
+    image-captcha "Refresh Image" variants.
+    """
+    return _RE_CAPTCHA.search(raw_bytes) is not None
+
+# Parse pool: libxml2 releases the GIL while parsing, so handing the HTML
+# parse to a worker lets the request thread (and other requests) make
+# progress during the CPU-heavy part of a fetch.
+_PARSE_POOL = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+def parse_case_html(raw_html):
+    """Extract parties, dates and order/judgment links from a case page.
+
+    Accepts bytes or str; both lxml and BeautifulSoup sniff the encoding
+    themselves, so callers can pass the undecoded response body.
+    """
+    # lxml.html gives us C-level tree traversal and XPath without the
+    # BeautifulSoup wrapper objects; BeautifulSoup (pure-Python parser, which
+    # accepts anything) remains as the fallback for documents lxml rejects.
+    try:
+        tree = lxml.html.fromstring(raw_html)
+    except Exception:
+        tree = None
+
+    # Generic parsing heuristics (these pages have variable structure)
+    fields = {}
+    if tree is not None:
+        # 1. Table-style layouts: label element followed by a value element.
+        for key, xpath in _FIELD_XPATHS.items():
+            value = " ".join(t.strip() for t in tree.xpath(xpath) if t.strip())
+            if value:
+                fields[key] = value
+        text = "\n".join(t for t in tree.itertext() if not t.isspace())
+        anchors = [(a.get("href"), a.text_content().strip()) for a in tree.xpath("//a[@href]")]
+    else:
+        soup = BeautifulSoup(raw_html, "html.parser")
+        text = soup.get_text(separator="\n")
+        anchors = [(a["href"], a.get_text(strip=True)) for a in soup.find_all("a", href=True)]
+
+    # 2. Label-in-text layouts ("Petitioner: ..."): single regex pass over
+    # the page text fills any fields the XPath probes missed.
+    for m in _RE_FIELDS.finditer(text):
+        key = m.group("k").lower()
+        if key not in fields:
+            fields[key] = m.group("v").strip()
+
+    # Orders/judgments: find PDF links. One pass over the anchors collects
+    # direct .pdf hrefs and the /viewOrder-style fallbacks; the fallbacks are
+    # only used when no real PDF link exists, preserving the old two-tier
+    # behaviour without a second DOM walk.
+    pdf_links = []
+    fallback_links = []
+    for href, label in anchors:
+        if href and _RE_PDFISH.search(href):
+            link = {"label": label, "url": href}
+            if href.lower().endswith(".pdf"):
+                pdf_links.append(link)
+            else:
+                fallback_links.append(link)
+    if not pdf_links:
+        pdf_links = fallback_links
+
+    return {
+        "petitioner": fields.get("petitioner"),
+        "respondent": fields.get("respondent"),
+        "filing_date": fields.get("filing date"),
+        "next_hearing": fields.get("next hearing date"),
+        "pdf_links": pdf_links
+    }
 
 def fetch_case_from_ecourts(case_type, case_number, filing_year):
     """
@@ -92,81 +273,48 @@ def fetch_case_from_ecourts(case_type, case_number, filing_year):
 
     # First attempt: central eCourts services entry page (GET)
     try:
-        r = requests.get(ECOURTS_SERVICE_BASE, params=params, timeout=12, headers={
-            "User-Agent": "Court-Data-Fetcher/1.0 (+https://github.com/yourname)"
-        })
+        r = _SESSION.get(ECOURTS_SERVICE_BASE, params=params, timeout=12)
     except Exception as e:
         return {"error": "network", "message": f"Network error while contacting eCourts: {e}"}
 
-    raw_html = r.text
+    # Keep the body as bytes end to end: r.text would run charset detection
+    # and decode hundreds of KB, but lxml handles encoding itself and the UI
+    # only ever shows a short snippet. Saving raw bytes to DB is handled by
+    # the caller.
+    raw_bytes = r.content
 
-    # Save raw HTML to DB will be handled by caller
+    # Detect if the page requires captcha (on the raw bytes, before parsing
+    # anything)
+    if detect_captcha_in_text(raw_bytes):
+        return {"captcha_required": True, "raw_bytes": raw_bytes, "message": "Target site requires CAPTCHA / challenge. Manual solve required."}
 
-    # Detect if the page requires captcha
-    if detect_captcha_in_text(raw_html):
-        return {"captcha_required": True, "raw_html": raw_html, "message": "Target site requires CAPTCHA / challenge. Manual solve required."}
+    # Try to parse parties / filing / next hearing / latest order link.
+    # The parse runs on a pool worker so this thread drops the GIL while
+    # libxml2 chews through the page.
+    parsed = _PARSE_POOL.submit(parse_case_html, raw_bytes).result()
 
-    # Try to parse parties / filing / next hearing / latest order link
-    soup = BeautifulSoup(raw_html, "html.parser")
-
-    # Generic parsing heuristics (these pages have variable structure)
-    # 1. Parties: try to find elements that contain 'Petitioner' or 'Petitioner Name' etc.
-    parties = {}
-    # look for labels
-    text = soup.get_text(separator="\n")
-    # Simple regex attempts
-    petitioner = None
-    respondent = None
-    m_pet = re.search(r"Petitioner[s]?\:?\s*(.+)", text, re.IGNORECASE)
-    if m_pet:
-        petitioner = m_pet.group(1).splitlines()[0].strip()
-    m_resp = re.search(r"Respondent[s]?\:?\s*(.+)", text, re.IGNORECASE)
-    if m_resp:
-        respondent = m_resp.group(1).splitlines()[0].strip()
-
-    # filing and next hearing
-    filing_date = None
-    next_hearing = None
-    m_filing = re.search(r"Filing Date\:?\s*([A-Za-z0-9 ,\-\/]+)", text, re.IGNORECASE)
-    if m_filing:
-        filing_date = m_filing.group(1).strip()
-    m_next = re.search(r"Next Hearing Date\:?\s*([A-Za-z0-9 ,\-\/]+)", text, re.IGNORECASE)
-    if m_next:
-        next_hearing = m_next.group(1).strip()
-
-    # Orders/judgments: find PDF links
-    pdf_links = []
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        if href.lower().endswith(".pdf"):
-            text_label = a.get_text(strip=True)
-            pdf_links.append({"label": text_label, "url": href})
-
-    # Fallback: try to find /viewOrder or /viewJudgement patterns
-    if not pdf_links:
-        for a in soup.find_all("a", href=True):
-            if "order" in a["href"].lower() or "judgement" in a["href"].lower() or "judgment" in a["href"].lower():
-                pdf_links.append({"label": a.get_text(strip=True), "url": a["href"]})
-
-    parsed = {
-        "petitioner": petitioner,
-        "respondent": respondent,
-        "filing_date": filing_date,
-        "next_hearing": next_hearing,
-        "pdf_links": pdf_links
-    }
-
-    return {"captcha_required": False, "raw_html": raw_html, "parsed": parsed}
+    return {"captcha_required": False, "raw_bytes": raw_bytes, "parsed": parsed}
 
 # ---------- ROUTES ----------
+# The search form is identical for every plain GET (the captcha question is
+# fetched by the page via /captcha), so render it once at startup and serve
+# the cached HTML. Only a GET carrying flashed messages from a redirect
+# still needs a real Jinja render.
+with app.test_request_context():
+    _INDEX_HTML = render_template("index.html")
+
+@app.route("/captcha")
+def captcha():
+    q, ans = generate_captcha()
+    session["captcha_answer"] = ans
+    return {"q": q}
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "GET":
-        # generate captcha and store answer in session
-        q, ans = generate_captcha()
-        session["captcha_answer"] = ans
-        session["captcha_q"] = q
-        return render_template("index.html", captcha_q=q)
+        if session.get("_flashes"):
+            return render_template("index.html")
+        return _INDEX_HTML
 
     # POST
     case_type = request.form.get("case_type", "").strip()
@@ -183,25 +331,42 @@ def index():
     expected = session.get("captcha_answer")
     if not expected or user_captcha != expected:
         flash("Captcha incorrect. Please try again.", "danger")
-        # regenerate captcha
-        q, ans = generate_captcha()
-        session["captcha_answer"] = ans
-        session["captcha_q"] = q
-        return render_template("index.html", captcha_q=q, case_type=case_type, case_number=case_number, filing_year=filing_year)
-
-    # Log query
-    qlog = QueryLog(case_type=case_type, case_number=case_number, filing_year=filing_year, ip=request.remote_addr)
-    db.session.add(qlog)
-    db.session.commit()
-
-    # Attempt fetch
-    fetch_result = fetch_case_from_ecourts(case_type, case_number, filing_year)
-
-    # Save raw response (if present)
-    raw_html = fetch_result.get("raw_html") or ""
-    r = RawResponse(query_id=qlog.id, raw_html=raw_html, parsed_json=json.dumps(fetch_result.get("parsed") or {}))
-    db.session.add(r)
-    db.session.commit()
+        # the page fetches a fresh question from /captcha on load
+        return render_template("index.html", case_type=case_type, case_number=case_number, filing_year=filing_year)
+
+    # Attempt fetch (served from cache when the same case was queried recently)
+    cache_key = (case_type, case_number, filing_year)
+    with _FETCH_CACHE_LOCK:
+        fetch_result = _FETCH_CACHE.get(cache_key)
+    if fetch_result is None:
+        fetch_result = fetch_case_from_ecourts(case_type, case_number, filing_year)
+        if not fetch_result.get("error") and not fetch_result.get("captcha_required"):
+            with _FETCH_CACHE_LOCK:
+                _FETCH_CACHE[cache_key] = fetch_result
+
+    # Log query + raw response in one Core transaction (single fsync, no ORM
+    # flush overhead). Only the first 4 KB are ever shown in the UI, so only
+    # that slice gets decoded; the full body stays bytes for storage.
+    raw_bytes = fetch_result.get("raw_bytes") or b""
+    snippet = raw_bytes[:4096].decode("utf-8", "replace")
+    with _ZSTD_COMPRESS_LOCK:
+        raw_html_zstd = _ZSTD_COMPRESS.compress(raw_bytes)
+    with db.engine.begin() as conn:
+        qid = conn.execute(
+            insert(query_logs_t).values(
+                case_type=case_type,
+                case_number=case_number,
+                filing_year=filing_year,
+                ip=request.remote_addr,
+            )
+        ).inserted_primary_key[0]
+        conn.execute(
+            insert(raw_responses_t).values(
+                query_id=qid,
+                raw_html_zstd=raw_html_zstd,
+                parsed_json=json.dumps(fetch_result.get("parsed") or {}),
+            )
+        )
 
     # handle errors and captcha
     if fetch_result.get("error"):
@@ -213,11 +378,11 @@ def index():
         flash("The court site is requiring a CAPTCHA or challenge for this search. Our app logged the query and raw response. You can either:")
         flash("1) Manually open the court site and solve their CAPTCHA (we cannot bypass it automatically).")
         flash("2) Use the saved raw response to debug or try again later.")
-        return render_template("result.html", parsed=None, captcha_block=True, raw_html_snippet=raw_html[:2000], query_id=qlog.id)
+        return render_template("result.html", parsed=None, captcha_block=True, raw_html_snippet=snippet, query_id=qid)
 
     parsed = fetch_result.get("parsed")
     # Render parsed details
-    return render_template("result.html", parsed=parsed, raw_html_snippet=raw_html[:2000], query_id=qlog.id)
+    return render_template("result.html", parsed=parsed, raw_html_snippet=snippet, query_id=qid)
 
 @app.route("/download_pdf")
 def download_pdf():
@@ -230,16 +395,16 @@ def download_pdf():
         # try to make absolute using services domain
         url = "https://services.ecourts.gov.in" + url
     try:
-        r = requests.get(url, stream=True, timeout=20)
+        r = _SESSION.get(url, stream=True, timeout=20)
     except Exception as e:
         flash(f"Failed to download PDF: {e}", "danger")
         return redirect(url_for("index"))
-    # return as attachment
-    return send_file(
-        io.BytesIO(r.content),
+    # Stream the PDF through in chunks instead of buffering the whole file
+    # (r.content + BytesIO) in memory before responding.
+    return Response(
+        stream_with_context(r.iter_content(chunk_size=65536)),
         mimetype="application/pdf",
-        as_attachment=True,
-        attachment_filename="order.pdf"
+        headers={"Content-Disposition": 'attachment; filename="order.pdf"'}
     )
 
 @app.route("/raw_response/<int:rid>")
@@ -248,7 +413,18 @@ def raw_response(rid):
     if not rr:
         flash("Not found.", "danger")
         return redirect(url_for("index"))
-    return rr.raw_html, 200, {"Content-Type": "text/html; charset=utf-8"}
+    raw_html = ""
+    if rr.raw_html_zstd:
+        with _ZSTD_DECOMPRESS_LOCK:
+            raw_html = _ZSTD_DECOMPRESS.decompress(rr.raw_html_zstd).decode("utf-8", "replace")
+    elif _HAS_LEGACY_RAW_HTML:
+        # row predates the compressed column; its HTML lives in the old
+        # (unmapped) raw_html TEXT column
+        with db.engine.connect() as conn:
+            row = conn.exec_driver_sql("SELECT raw_html FROM raw_responses WHERE id = ?", (rid,)).first()
+        if row and row[0]:
+            raw_html = row[0]
+    return raw_html, 200, {"Content-Type": "text/html; charset=utf-8"}
 
 # ---------- RUN ----------
 if __name__ == "__main__":